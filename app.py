@@ -3,16 +3,33 @@ import os
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import PromptTemplate
+from langchain_core.output_parsers import JsonOutputParser
 from gtts import gTTS
-import base64
 import io
+import hashlib
+import threading
+import httpx
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 openai_api_key = os.getenv("OPENAI_API_KEY")
 
-# Initialize LangChain LLM
-llm = ChatOpenAI(temperature=0.7, openai_api_key=openai_api_key, model_name="gpt-3.5-turbo")
+# Initialize LangChain LLM once per process so its HTTP connection pool survives reruns
+@st.cache_resource(show_spinner=False)
+def get_llm():
+    return ChatOpenAI(temperature=0.7, openai_api_key=openai_api_key, model_name="gpt-3.5-turbo",
+                      streaming=True, model_kwargs={"response_format": {"type": "json_object"}},
+                      http_client=httpx.Client(limits=httpx.Limits(max_keepalive_connections=20)))
+
+llm = get_llm()
+
+# On-disk cache for synthesized speech
+TTS_CACHE_DIR = os.path.join("data", "tts_cache")
+os.makedirs(TTS_CACHE_DIR, exist_ok=True)
 
 # Page configuration
 st.set_page_config(page_title="English Reading Adventure", page_icon="📚")
@@ -25,6 +42,8 @@ if "passages_completed" not in st.session_state:
     st.session_state.passages_completed = 0
 if "vocab_learned" not in st.session_state:
     st.session_state.vocab_learned = []
+if "vocab_learned_set" not in st.session_state:
+    st.session_state.vocab_learned_set = set(st.session_state.vocab_learned)
 
 # Sidebar for progress tracking
 with st.sidebar:
@@ -34,71 +53,132 @@ with st.sidebar:
     st.write(f"Vocabulary Learned: {len(st.session_state.vocab_learned)} words")
     if st.session_state.vocab_learned:
         st.write("Words Learned:")
-        for word in st.session_state.vocab_learned:
-            st.write(f"- {word}")
-
-# Prompt templates for LangChain
-passage_prompt = PromptTemplate(
-    input_variables=["grade_level"],
-    template="Generate a short, engaging reading passage (100-150 words) suitable for a {grade_level} grader. The passage should be fun, use simple vocabulary, and include 3-5 new words a 7th grader might not know. Provide a list of the new words with their definitions."
-)
-question_prompt = PromptTemplate(
-    input_variables=["passage"],
-    template="Generate 3 comprehension questions based on the following passage:\n{passage}"
-)
-quiz_prompt = PromptTemplate(
-    input_variables=["passage"],
-    template="Generate a vocabulary quiz with 3 multiple-choice questions based on the new words in the following passage:\n{passage}"
-)
-
-# Function to generate passage and vocabulary
-def generate_passage():
-    response = llm.invoke(passage_prompt.format(grade_level="5th")).content
-    print(response)
-    passage, vocab = response.split("**Vocabulary:**")
-    passage = passage.strip()
-    vocab = vocab.strip().split("\n")
-    vocab_dict = {line.split(":")[0].strip(): line.split(":")[1].strip() for line in vocab if ":" in line}
-    return passage, vocab_dict
-
-# Function to generate comprehension questions
-def generate_questions(passage):
-    response = llm.invoke(question_prompt.format(passage=passage)).content
-    questions = response.split("\n")
-    return [q for q in questions if q.strip()]
-
-# Function to generate vocabulary quiz
-def generate_quiz(passage):
-    response = llm.invoke(quiz_prompt.format(passage=passage)).content
-    questions = response.split("\n")
-    return [q for q in questions if q.strip()]
-
-# Function for text-to-speech
-def text_to_speech(text):
+        st.markdown("\n".join(f"- {word}" for word in st.session_state.vocab_learned))
+
+# Prompt template for LangChain, built once with the grade level filled in
+@st.cache_resource(show_spinner=False)
+def get_activity_prompt():
+    activity_prompt = PromptTemplate(
+        input_variables=["grade_level"],
+        template="Generate a short, engaging reading passage (100-150 words) suitable for a {grade_level} grader. The passage should be fun, use simple vocabulary, and include 3-5 new words a 7th grader might not know. "
+                 "Then write 3 comprehension questions about the passage and a vocabulary quiz with 3 multiple-choice questions about the new words. "
+                 'Respond with a JSON object with the keys "passage" (string), "vocabulary" (object mapping each new word to its definition), '
+                 '"questions" (list of 3 strings) and "quiz" (list of 3 objects, each with a "question" string and an "options" list of 4 answer choices).'
+    )
+    return activity_prompt.partial(grade_level="5th")
+
+activity_prompt_5th = get_activity_prompt()
+
+activity_chain = llm | JsonOutputParser()
+
+# Function to generate the passage, vocabulary, questions and quiz in a single LLM call.
+# The passage is shown in `placeholder` as it streams in, and its audio starts
+# synthesizing as soon as the model moves on to the vocabulary.
+def generate_all(placeholder=None):
+    data = {}
+    passage_warmed = False
+    for data in activity_chain.stream(activity_prompt_5th.format()):
+        if placeholder is not None and data.get("passage"):
+            placeholder.write(data["passage"])
+        if not passage_warmed and "vocabulary" in data and isinstance(data.get("passage"), str) and data["passage"].strip():
+            warm_speech([data["passage"].strip()])
+            passage_warmed = True
+    logger.debug("LLM response: %s", data)
+    # JSON mode does not enforce a schema, so skip any entry with the wrong shape
+    passage = data.get("passage")
+    passage = passage.strip() if isinstance(passage, str) else ""
+    vocabulary = data.get("vocabulary")
+    vocab_dict = {
+        word.strip(): definition.strip()
+        for word, definition in (vocabulary.items() if isinstance(vocabulary, dict) else [])
+        if isinstance(word, str) and isinstance(definition, str) and word.strip()
+    }
+    questions = data.get("questions")
+    questions = [q for q in (questions if isinstance(questions, list) else []) if isinstance(q, str) and q.strip()]
+    quiz = []
+    for q in data.get("quiz") if isinstance(data.get("quiz"), list) else []:
+        if not isinstance(q, dict) or not isinstance(q.get("question"), str) or not q["question"].strip():
+            continue
+        options = q.get("options")
+        options = [str(option) for option in options] if isinstance(options, list) else []
+        if options:
+            quiz.append({"question": q["question"], "options": options})
+    return passage, vocab_dict, questions, quiz
+
+# Function to synthesize speech, reusing MP3s saved by earlier runs
+def synthesize_speech(text):
+    cache_path = os.path.join(TTS_CACHE_DIR, hashlib.sha256(text.encode("utf-8")).hexdigest() + ".mp3")
+    try:
+        with open(cache_path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
     tts = gTTS(text=text, lang="en")
     audio_file = io.BytesIO()
     tts.write_to_fp(audio_file)
-    audio_file.seek(0)
-    audio_b64 = base64.b64encode(audio_file.read()).decode()
-    audio_html = f'<audio autoplay controls><source src="data:audio/mp3;base64,{audio_b64}" type="audio/mp3"></audio>'
-    return audio_html
+    audio_bytes = audio_file.getvalue()
+    # Sessions are threads of one process, so the thread id keeps temp files apart
+    tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(audio_bytes)
+    os.replace(tmp_path, cache_path)
+    return audio_bytes
+
+# Background pool for speech synthesis, plus the clips still in flight so a
+# render can wait on them instead of requesting the same audio twice
+@st.cache_resource(show_spinner=False)
+def get_speech_warmer():
+    return {"executor": ThreadPoolExecutor(max_workers=4, thread_name_prefix="tts-warm"), "pending": {}, "lock": threading.RLock()}
+
+# Function for text-to-speech
+@st.cache_data(max_entries=512, show_spinner=False)
+def text_to_speech(text):
+    future = get_speech_warmer()["pending"].get(text)
+    if future is not None:
+        try:
+            return future.result()
+        except Exception:
+            pass  # Warming failed; synthesize it here instead
+    return synthesize_speech(text)
+
+# Function to start synthesizing texts in the background; results land in the disk cache
+def warm_speech(texts):
+    warmer = get_speech_warmer()
+    with warmer["lock"]:
+        for text in dict.fromkeys(texts):
+            if text not in warmer["pending"]:
+                future = warmer["executor"].submit(synthesize_speech, text)
+                warmer["pending"][text] = future
+                future.add_done_callback(lambda _, text=text: forget_warmed_speech(text))
+
+def forget_warmed_speech(text):
+    warmer = get_speech_warmer()
+    with warmer["lock"]:
+        warmer["pending"].pop(text, None)
 
 # Main app logic
 st.header("Start Your Reading Adventure!")
 if st.button("Get a New Reading Passage"):
-    passage, vocab_dict = generate_passage()
-    st.session_state.passage = passage
-    st.session_state.vocab_dict = vocab_dict
-    st.session_state.questions = generate_questions(passage)
-    st.session_state.quiz = generate_quiz(passage)
-    st.session_state.passages_completed += 1
-    st.session_state.points += 10  # Award points for starting a passage
+    preview = st.empty()
+    passage, vocab_dict, questions, quiz = generate_all(preview)
+    preview.empty()
+    if not passage:
+        # JSON mode does not enforce the schema; keep the previous passage and points
+        st.error("The passage could not be generated. Please try again.")
+    else:
+        st.session_state.passage = passage
+        st.session_state.vocab_dict = vocab_dict
+        st.session_state.questions = questions
+        st.session_state.quiz = quiz
+        warm_speech(vocab_dict)  # Word audio is ready by the time a button is pressed
+        st.session_state.passages_completed += 1
+        st.session_state.points += 10  # Award points for starting a passage
 
 # Display passage if available
 if "passage" in st.session_state:
     st.subheader("Reading Passage")
     st.write(st.session_state.passage)
-    st.markdown(text_to_speech(st.session_state.passage), unsafe_allow_html=True)
+    st.audio(text_to_speech(st.session_state.passage), format="audio/mp3")
 
     # Vocabulary section
     st.subheader("New Words")
@@ -106,10 +186,11 @@ if "passage" in st.session_state:
         col1, col2 = st.columns([1, 4])
         with col1:
             if st.button(f"Listen: {word}"):
-                st.markdown(text_to_speech(word), unsafe_allow_html=True)
+                st.audio(text_to_speech(word), format="audio/mp3", autoplay=True)
         with col2:
             st.write(f"**{word}**: {definition}")
-            if word not in st.session_state.vocab_learned:
+            if word not in st.session_state.vocab_learned_set:
+                st.session_state.vocab_learned_set.add(word)
                 st.session_state.vocab_learned.append(word)
                 st.session_state.points += 5  # Award points for learning a word
 
@@ -129,9 +210,8 @@ if "passage" in st.session_state:
     st.subheader("Vocabulary Quiz")
     with st.form("quiz_form"):
         quiz_answers = []
-        for i, question in enumerate(st.session_state.quiz[:3], 1):
-            options = ["Option A", "Option B", "Option C", "Option D"]  # Simplified for demo
-            answer = st.radio(f"Q{i}: {question}", options, key=f"quiz_q{i}")
+        for i, quiz_question in enumerate(st.session_state.quiz[:3], 1):
+            answer = st.radio(f"Q{i}: {quiz_question['question']}", quiz_question["options"], key=f"quiz_q{i}")
             quiz_answers.append(answer)
         quiz_submitted = st.form_submit_button("Submit Quiz")
         if quiz_submitted:
@@ -1,52 +1,55 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import os
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import PromptTemplate
-from pydantic import BaseModel, Field
-from typing import List, Dict
-from gtts import gTTS
-import base64
+from typing import List
+from typing_extensions import Annotated, TypedDict
 import io
-import json
+import hashlib
+import orjson
+import re
+import sqlite3
 from datetime import datetime
 import threading
+from contextlib import contextmanager
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Load environment variables
 load_dotenv()
 openai_api_key = os.getenv("OPENAI_API_KEY") or st.secrets["openai_api_key"]
 
-# Pydantic models for structured output
-class VocabularyWord(BaseModel):
-    word: str = Field(description="The vocabulary word")
-    definition: str = Field(description="Simple definition suitable for 2th graders")
-
-class ReadingPassage(BaseModel):
-    passage: str = Field(description="The reading passage content (100 words)")
-    vocabulary: List[VocabularyWord] = Field(description="List of 3-5 new vocabulary words with definitions")
-
-class ComprehensionQuestions(BaseModel):
-    questions: List[str] = Field(description="List of 3 comprehension questions about the passage")
-
-class QuizOption(BaseModel):
-    option: str = Field(description="Multiple choice option")
-    is_correct: bool = Field(description="Whether this option is correct")
-
-class VocabularyQuizQuestion(BaseModel):
-    question: str = Field(description="The quiz question")
-    options: List[QuizOption] = Field(description="4 multiple choice options")
-
-class VocabularyQuiz(BaseModel):
-    questions: List[VocabularyQuizQuestion] = Field(description="List of 3 vocabulary quiz questions")
-
-# Initialize LangChain LLM
-llm = ChatOpenAI(model="gpt-4o-mini",temperature=0.7, openai_api_key=openai_api_key)
+# TypedDict schemas for structured output; responses come back as plain dicts
+class VocabularyWord(TypedDict):
+    word: Annotated[str, ..., "The vocabulary word"]
+    definition: Annotated[str, ..., "Simple definition suitable for 2th graders"]
+
+class QuizOption(TypedDict):
+    option: Annotated[str, ..., "Multiple choice option"]
+    is_correct: Annotated[bool, ..., "Whether this option is correct"]
+
+class VocabularyQuizQuestion(TypedDict):
+    question: Annotated[str, ..., "The quiz question"]
+    options: Annotated[List[QuizOption], ..., "4 multiple choice options"]
+
+class ReadingActivity(TypedDict):
+    passage: Annotated[str, ..., "The reading passage content (100 words)"]
+    vocabulary: Annotated[List[VocabularyWord], ..., "List of 3-5 new vocabulary words with definitions"]
+    questions: Annotated[List[str], ..., "List of 3 comprehension questions about the passage"]
+    quiz: Annotated[List[VocabularyQuizQuestion], ..., "List of 3 vocabulary quiz questions"]
+
+# Initialize LangChain LLM and the structured output model once per process,
+# so the HTTP connection pool and the output schema survive reruns
+@st.cache_resource(show_spinner=False)
+def get_activity_model():
+    import httpx
+    from langchain_openai import ChatOpenAI
+    
+    llm = ChatOpenAI(model="gpt-4o-mini",temperature=0.7, openai_api_key=openai_api_key,
+                     http_client=httpx.Client(limits=httpx.Limits(max_keepalive_connections=10)))
+    return llm.with_structured_output(ReadingActivity, method="json_schema")
 
-# Create structured output models
-passage_model = llm.with_structured_output(ReadingPassage)
-questions_model = llm.with_structured_output(ComprehensionQuestions)
-quiz_model = llm.with_structured_output(VocabularyQuiz)
+activity_model = get_activity_model()
 
 # Page configuration
 st.set_page_config(page_title="English Reading Adventure", page_icon="📚")
@@ -54,123 +57,196 @@ st.title("📚 English Reading Adventure for 8th Graders")
 
 # JSON storage configuration
 DATA_DIR = "data"
-PASSAGES_FILE = os.path.join(DATA_DIR, "passages.json")
+PASSAGES_FILE = os.path.join(DATA_DIR, "passages.json")  # Legacy pool, imported into the database once
+DB_FILE = os.path.join(DATA_DIR, "app.db")
+TTS_CACHE_DIR = os.path.join(DATA_DIR, "tts")  # MP3s named by a hash of their text
 USER_PROGRESS_FILE = os.path.join(DATA_DIR, "user_progress.json")
 MAX_PASSAGES = 5  # Keep exactly 5 passages in rotation
 
-# Create data directory if it doesn't exist
-if not os.path.exists(DATA_DIR):
-    os.makedirs(DATA_DIR)
+# Create data directories if they don't exist
+os.makedirs(TTS_CACHE_DIR, exist_ok=True)
 
 # Enhanced JSON storage functions
+def file_version(path):
+    """Return a key that changes whenever the file is rewritten, or None if it is missing"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def read_json_file(path, version):
+    """Parse a JSON file; cached per file version so reruns skip the disk read"""
+    with open(path, 'rb') as f:
+        return orjson.loads(f.read())
+
+def write_json_file(path, data):
+    """Encode JSON in one pass and atomically swap it into place"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    os.replace(tmp_path, path)
+
+@st.cache_resource(show_spinner=False)
+def get_db():
+    """Open the passage pool database once per process, importing passages.json on first use"""
+    conn = sqlite3.connect(DB_FILE, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS passages (id INTEGER PRIMARY KEY, passage_id INTEGER, data BLOB NOT NULL, created_at TEXT)")
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    
+    # passages.json is never written after the migration, so import it only once;
+    # a pool drained later must not bring back passages that were already read
+    with immediate_transaction(conn):
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_imported'").fetchone() is None:
+            if conn.execute("SELECT COUNT(*) FROM passages").fetchone()[0] == 0:
+                try:
+                    with open(PASSAGES_FILE, 'rb') as f:
+                        data = orjson.loads(f.read())
+                except FileNotFoundError:
+                    data = {}
+                if data.get('passages'):
+                    write_passages(conn, data['passages'], data.get('current_index', 0))
+            conn.execute("INSERT INTO meta (key, value) VALUES ('legacy_imported', '1')")
+    return conn
+
+@st.cache_resource(show_spinner=False)
+def get_db_lock():
+    """The connection is shared across threads, so transactions must not interleave"""
+    return threading.RLock()
+
+def read_current_index(conn):
+    row = conn.execute("SELECT value FROM meta WHERE key = 'current_index'").fetchone()
+    return int(row[0]) if row else 0
+
+def write_current_index(conn, current_index):
+    conn.execute(
+        "INSERT INTO meta (key, value) VALUES ('current_index', ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (str(current_index),)
+    )
+
+@contextmanager
+def immediate_transaction(conn):
+    """Hold the write lock for a whole read-modify-write, also against other processes"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+@contextmanager
+def pool_transaction():
+    with get_db_lock():
+        with immediate_transaction(get_db()) as conn:
+            yield conn
+
+def write_passages(conn, passages, current_index):
+    """Replace the whole pool"""
+    conn.execute("DELETE FROM passages")
+    conn.executemany(
+        "INSERT INTO passages (passage_id, data, created_at) VALUES (?, ?, ?)",
+        [(p.get('id'), orjson.dumps(p), p.get('created_at')) for p in passages]
+    )
+    write_current_index(conn, current_index)
+
 def load_passages_data():
-    """Load all passages data from JSON file"""
-    if os.path.exists(PASSAGES_FILE):
-        with open(PASSAGES_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            return data.get('passages', []), data.get('current_index', 0)
-    return [], 0
+    """Load all passages and the rotation index from the database"""
+    conn = get_db()
+    with get_db_lock():
+        rows = conn.execute("SELECT data FROM passages ORDER BY id").fetchall()
+        return [orjson.loads(row[0]) for row in rows], read_current_index(conn)
 
 def save_passages_data(passages, current_index=0):
     """Save passages data with rotation management"""
-    data = {
-        'passages': passages,
-        'current_index': current_index,
-        'last_updated': datetime.now().isoformat(),
-        'total_passages': len(passages)
-    }
-    
-    with open(PASSAGES_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    with pool_transaction() as conn:
+        write_passages(conn, passages, current_index)
+
+def get_pool_status():
+    """Return the pool size and rotation index without decoding any passages"""
+    conn = get_db()
+    with get_db_lock():
+        return conn.execute("SELECT COUNT(*) FROM passages").fetchone()[0], read_current_index(conn)
 
 def get_next_passage():
     """Get the next passage in rotation and update index"""
-    passages, current_index = load_passages_data()
-    
-    if not passages:
-        return None, 0
-    
-    # Get current passage
-    current_passage = passages[current_index]
-    
-    # Update index for next time (rotate through 5 passages)
-    next_index = (current_index + 1) % len(passages)
-    save_passages_data(passages, next_index)
+    with pool_transaction() as conn:
+        count = conn.execute("SELECT COUNT(*) FROM passages").fetchone()[0]
+        if not count:
+            return None, 0
+        
+        # Get current passage
+        current_index = read_current_index(conn) % count
+        row = conn.execute("SELECT data FROM passages ORDER BY id LIMIT 1 OFFSET ?", (current_index,)).fetchone()
+        
+        # Update index for next time (rotate through 5 passages)
+        write_current_index(conn, (current_index + 1) % count)
     
-    return current_passage, current_index
+    return orjson.loads(row[0]), current_index
 
 def add_or_replace_passage(new_passage_data):
     """Add new passage or replace oldest one if we have 5"""
-    passages, current_index = load_passages_data()
-    
-    # Add timestamp and ID
-    new_passage_data['created_at'] = datetime.now().isoformat()
-    new_passage_data['id'] = len(passages) + 1 if len(passages) < MAX_PASSAGES else passages[0]['id'] + MAX_PASSAGES
-    
-    if len(passages) < MAX_PASSAGES:
-        # Add new passage if we don't have 5 yet
-        passages.append(new_passage_data)
-    else:
-        # Replace the oldest passage (FIFO rotation)
-        replace_index = (current_index + len(passages) - 1) % len(passages)  # Replace the one that will be served last
-        passages[replace_index] = new_passage_data
+    with pool_transaction() as conn:
+        rows = conn.execute("SELECT id, passage_id FROM passages ORDER BY id").fetchall()
+        current_index = read_current_index(conn)
+        
+        # Add timestamp and ID
+        new_passage_data['created_at'] = datetime.now().isoformat()
+        new_passage_data['id'] = len(rows) + 1 if len(rows) < MAX_PASSAGES else rows[0][1] + MAX_PASSAGES
+        values = (new_passage_data['id'], orjson.dumps(new_passage_data), new_passage_data['created_at'])
+        
+        if len(rows) < MAX_PASSAGES:
+            # Add new passage if we don't have 5 yet
+            conn.execute("INSERT INTO passages (passage_id, data, created_at) VALUES (?, ?, ?)", values)
+        else:
+            # Replace the oldest passage (FIFO rotation)
+            replace_index = (current_index + len(rows) - 1) % len(rows)  # Replace the one that will be served last
+            conn.execute("UPDATE passages SET passage_id = ?, data = ?, created_at = ? WHERE id = ?", (*values, rows[replace_index][0]))
     
-    save_passages_data(passages, current_index)
     return new_passage_data['id']
 
 def remove_current_passage():
-    """Remove the current passage from the JSON file"""
+    """Remove the current passage from the pool"""
     if "current_passage_id" in st.session_state:
-        passages, current_index = load_passages_data()
-        # Remove passage with matching ID
-        passages = [p for p in passages if p.get('id') != st.session_state.current_passage_id]
-        save_passages_data(passages, 0)  # Reset index after removal
+        with pool_transaction() as conn:
+            conn.execute("DELETE FROM passages WHERE passage_id = ?", (st.session_state.current_passage_id,))
+            write_current_index(conn, 0)  # Reset index after removal
         return True
     return False
 
 # Background generation functions
+def build_passage_data():
+    """Generate one passage and shape it for JSON storage"""
+    response = activity_model.invoke(ACTIVITY_PROMPT)
+    
+    return {
+        "passage": response["passage"],
+        "sentences": split_into_sentences(response["passage"]),  # Stored so reruns never re-split
+        "vocabulary": {word["word"]: word["definition"] for word in response["vocabulary"]},
+        "questions": response["questions"],
+        "quiz": response["quiz"],
+        "status": "complete"
+    }
+
 def generate_passage_background():
     """Generate a new passage in the background"""
     try:
-        response = passage_model.invoke(passage_prompt.format(grade_level="2th"))
-        
-        # Prepare data for JSON storage
-        passage_data = {
-            "passage": response.passage,
-            "vocabulary": {word.word: word.definition for word in response.vocabulary},
-            "questions": [],
-            "quiz": [],
-            "status": "generating_questions"
-        }
-        
-        # Generate questions
-        questions_response = questions_model.invoke(question_prompt.format(passage=response.passage))
-        passage_data["questions"] = questions_response.questions
-        passage_data["status"] = "generating_quiz"
-        
-        # Generate quiz
-        vocab_str = ", ".join([f"{word}: {definition}" for word, definition in passage_data["vocabulary"].items()])
-        quiz_response = quiz_model.invoke(quiz_prompt.format(passage=response.passage, vocabulary=vocab_str))
-        
-        # Convert quiz questions to JSON-serializable format
-        quiz_data = []
-        for q in quiz_response.questions:
-            quiz_data.append({
-                "question": q.question,
-                "options": [{"option": opt.option, "is_correct": opt.is_correct} for opt in q.options]
-            })
-        
-        passage_data["quiz"] = quiz_data
-        passage_data["status"] = "complete"
-        
         # Add to rotation
-        add_or_replace_passage(passage_data)
+        add_or_replace_passage(build_passage_data())
         
         return True
     except Exception as e:
         st.error(f"Background generation error: {e}")
         return False
 
+# Shared worker pool for background generation; bounded so rapid clicks
+# cannot pile up unlimited OpenAI requests
+@st.cache_resource(show_spinner=False)
+def get_background_executor():
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="bg-gen")
+
 def initialize_passages():
     """Initialize with 5 passages if none exist"""
     passages, _ = load_passages_data()
@@ -178,21 +254,26 @@ def initialize_passages():
     if len(passages) < MAX_PASSAGES:
         st.info(f"Initializing reading passages... ({len(passages)}/{MAX_PASSAGES} ready)")
         
-        # Generate missing passages
-        for i in range(MAX_PASSAGES - len(passages)):
-            if generate_passage_background():
-                st.success(f"Generated passage {len(passages) + i + 1}/{MAX_PASSAGES}")
-            else:
-                st.error(f"Failed to generate passage {len(passages) + i + 1}")
+        # Generate missing passages concurrently; the pool is only written
+        # from this thread so st.success/st.error stay in the script context
+        missing = MAX_PASSAGES - len(passages)
+        with ThreadPoolExecutor(max_workers=missing) as executor:
+            futures = [executor.submit(build_passage_data) for _ in range(missing)]
+            for i, future in enumerate(as_completed(futures)):
+                try:
+                    add_or_replace_passage(future.result())
+                    st.success(f"Generated passage {len(passages) + i + 1}/{MAX_PASSAGES}")
+                except Exception as e:
+                    st.error(f"Failed to generate passage {len(passages) + i + 1}: {e}")
         
         st.success("All passages ready!")
 
 # JSON storage functions
 def load_user_progress():
     """Load user progress from JSON file"""
-    if os.path.exists(USER_PROGRESS_FILE):
-        with open(USER_PROGRESS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
+    version = file_version(USER_PROGRESS_FILE)
+    if version is not None:
+        return read_json_file(USER_PROGRESS_FILE, version)
     return {
         "points": 0,
         "passages_completed": 0,
@@ -203,22 +284,17 @@ def load_user_progress():
 
 def save_user_progress(progress_data):
     """Save user progress to JSON file"""
-    progress_data['last_updated'] = datetime.now().isoformat()
-    with open(USER_PROGRESS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(progress_data, f, indent=2, ensure_ascii=False)
+    progress_data['last_updated'] = datetime.now()
+    write_json_file(USER_PROGRESS_FILE, progress_data)
 
 # Initialize session state for points and progress
 if "points" not in st.session_state:
     progress = load_user_progress()
     st.session_state.points = progress.get("points", 0)
-if "passages_completed" not in st.session_state:
-    progress = load_user_progress()
     st.session_state.passages_completed = progress.get("passages_completed", 0)
-if "vocab_learned" not in st.session_state:
-    progress = load_user_progress()
-    st.session_state.vocab_learned = progress.get("vocab_learned", [])
-if "generating_in_background" not in st.session_state:
-    st.session_state.generating_in_background = False
+    st.session_state.vocab_learned = dict.fromkeys(progress.get("vocab_learned", []))  # Ordered set of words
+if "background_generation" not in st.session_state:
+    st.session_state.background_generation = None  # Future of the running generation
 if "speech_speed" not in st.session_state:
     st.session_state.speech_speed = 0.8  # Default slow speed
 if "reading_start_time" not in st.session_state:
@@ -244,11 +320,12 @@ with st.sidebar:
     st.write("📝 Note: Speech includes pauses between words for better learning")
     
     st.header("Passage Pool Status")
-    passages, current_index = load_passages_data()
-    st.write(f"Available Passages: {len(passages)}/{MAX_PASSAGES}")
+    passage_count, current_index = get_pool_status()
+    st.write(f"Available Passages: {passage_count}/{MAX_PASSAGES}")
     st.write(f"Next Passage Index: {current_index + 1}")
     
-    if st.session_state.generating_in_background:
+    background_generation = st.session_state.background_generation
+    if background_generation is not None and not background_generation.done():
         st.write("🔄 Generating new content in background...")
     
     # st.header("Data Management")
@@ -256,148 +333,134 @@ with st.sidebar:
     #     progress_data = {
     #         "points": st.session_state.points,
     #         "passages_completed": st.session_state.passages_completed,
-    #         "vocab_learned": st.session_state.vocab_learned
+    #         "vocab_learned": list(st.session_state.vocab_learned)
     #     }
     #     save_user_progress(progress_data)
     #     st.success("Progress saved!")
     
     # if st.button("Reset Passage Pool"):
-    #     if os.path.exists(PASSAGES_FILE):
-    #         os.remove(PASSAGES_FILE)
+    #     save_passages_data([], 0)
     #     st.success("Passage pool reset! Refresh to regenerate.")
 
-# Simplified prompt templates for structured output
-passage_prompt = PromptTemplate(
-    input_variables=["grade_level"],
-    template="""Generate a short, engaging reading passage suitable for a {grade_level} grader. 
-    The passage should be fun, use simple vocabulary, and include 1-3 new words a 2th grader might not know.
-    Return the passage and vocabulary words with their definitions."""
-)
-
-question_prompt = PromptTemplate(
-    input_variables=["passage"],
-    template="""Generate 3 comprehension questions based on the following passage:
-    {passage}
-    
-    Return exactly 3 questions that test understanding of the passage."""
-)
-
-quiz_prompt = PromptTemplate(
-    input_variables=["passage", "vocabulary"],
-    template="""Generate a vocabulary quiz with 3 multiple-choice questions based on the vocabulary words from the following passage:
-    Passage: {passage}
-    Vocabulary: {vocabulary}
-    
-    Each question should have 4 options with only one correct answer.
-    Focus on testing the meaning and usage of the vocabulary words."""
-)
-
-# Updated function to generate passage and vocabulary
+# Prompt for structured output; the grade level is fixed, so the text is built once
+GRADE_LEVEL = "2th"
+# Fixed instructions go in the system message; the request itself is the human message
+ACTIVITY_PROMPT = [
+    ("system",
+     "You write reading activities for young English learners. "
+     "Passages should be fun, use simple vocabulary, and include 1-3 new words the reader might not know. "
+     "Each activity has 3 comprehension questions about the passage and a vocabulary quiz with 3 multiple-choice questions, "
+     "each with 4 options and only one correct answer, testing the meaning and usage of the vocabulary words."),
+    ("human", f"Generate a short, engaging reading passage suitable for a {GRADE_LEVEL} grader."),
+]
+
+# Updated function to generate passage, vocabulary, questions and quiz
 def generate_passage():
     try:
-        response = passage_model.invoke(passage_prompt.format(grade_level="2th"))
-        
-        # Prepare data for JSON storage
-        passage_data = {
-            "passage": response.passage,
-            "vocabulary": {word.word: word.definition for word in response.vocabulary},
-            "questions": [],
-            "quiz": []
-        }
-        
-        return response.passage, {word.word: word.definition for word in response.vocabulary}, passage_data
+        passage_data = build_passage_data()
+        return passage_data["passage"], passage_data["vocabulary"], passage_data
     except Exception as e:
         st.error(f"Error generating passage: {e}")
         # Fallback to simple passage
         passage_data = {
             "passage": "This is a sample passage for testing.",
             "vocabulary": {"sample": "example word"},
-            "questions": [],
+            "questions": ["Sample question 1?", "Sample question 2?", "Sample question 3?"],
             "quiz": []
         }
-        return "This is a sample passage for testing.", {"sample": "example word"}, passage_data
+        return passage_data["passage"], passage_data["vocabulary"], passage_data
 
-# Updated function to generate comprehension questions
-def generate_questions(passage, passage_data=None):
-    try:
-        response = questions_model.invoke(question_prompt.format(passage=passage))
-        questions = response.questions
-        
-        # Update passage data if provided
-        if passage_data:
-            passage_data["questions"] = questions
-            
-        return questions
-    except Exception as e:
-        st.error(f"Error generating questions: {e}")
-        questions = ["Sample question 1?", "Sample question 2?", "Sample question 3?"]
-        if passage_data:
-            passage_data["questions"] = questions
-        return questions
-
-# Updated function to generate vocabulary quiz
-def generate_quiz(passage, vocab_dict, passage_data=None):
+# Function to synthesize speech as MP3 bytes, reusing the on-disk copy when one exists
+def synthesize_speech(text):
+    # Always use slow speech for learning
+    slow = True
+    path = os.path.join(TTS_CACHE_DIR, hashlib.sha1(f"{slow}:{text}".encode("utf-8")).hexdigest() + ".mp3")
     try:
-        vocab_str = ", ".join([f"{word}: {definition}" for word, definition in vocab_dict.items()])
-        response = quiz_model.invoke(quiz_prompt.format(passage=passage, vocabulary=vocab_str))
-        
-        # Convert quiz questions to JSON-serializable format
-        quiz_data = []
-        for q in response.questions:
-            quiz_data.append({
-                "question": q.question,
-                "options": [{"option": opt.option, "is_correct": opt.is_correct} for opt in q.options]
-            })
-        
-        # Update passage data if provided
-        if passage_data:
-            passage_data["quiz"] = quiz_data
-            
-        return response.questions
-    except Exception as e:
-        st.error(f"Error generating quiz: {e}")
-        if passage_data:
-            passage_data["quiz"] = []
-        return []
-
-# Function for text-to-speech
-def text_to_speech(text):
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    
+    from gtts import gTTS
+    
     # Add pauses between words for better learning
     words = text.split()
     text_with_pauses = " ... ".join(words)  # Add pauses between words
     
-    # Always use slow speech for learning
-    tts = gTTS(text=text_with_pauses, lang="en", slow=True)
+    tts = gTTS(text=text_with_pauses, lang="en", slow=slow)
     audio_file = io.BytesIO()
     tts.write_to_fp(audio_file)
-    audio_file.seek(0)
-    audio_b64 = base64.b64encode(audio_file.read()).decode()
+    audio_bytes = audio_file.getvalue()
+    
+    # Write atomically so a concurrent reader never sees a partial MP3
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(audio_bytes)
+    os.replace(tmp_path, path)
+    return audio_bytes
+
+# Dedicated pool for audio warming, kept apart from passage generation, plus the
+# clips it is still working on so a button press can wait instead of re-requesting
+@st.cache_resource(show_spinner=False)
+def get_speech_warmer():
+    return {"executor": ThreadPoolExecutor(max_workers=4, thread_name_prefix="tts-warm"), "pending": {}, "lock": threading.RLock()}
+
+# Cached wrapper so replaying the same text skips the gTTS request
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_speech(text):
+    future = get_speech_warmer()["pending"].get(text)
+    if future is not None:
+        try:
+            return future.result()
+        except Exception:
+            pass  # Warming failed; synthesize it here instead
+    return synthesize_speech(text)
+
+# Fill the on-disk MP3 cache ahead of playback; runs off the click path, and any
+# clip that fails here is simply synthesized when its button is pressed
+def warm_speech_cache(texts):
+    warmer = get_speech_warmer()
+    with warmer["lock"]:
+        for text in dict.fromkeys(texts):
+            if text not in warmer["pending"]:
+                future = warmer["executor"].submit(synthesize_speech, text)
+                warmer["pending"][text] = future
+                future.add_done_callback(lambda _, text=text: forget_warmed_speech(text))
+
+def forget_warmed_speech(text):
+    warmer = get_speech_warmer()
+    with warmer["lock"]:
+        warmer["pending"].pop(text, None)
+
+# Function for text-to-speech
+def text_to_speech(text):
+    return cached_speech(text)
+
+# Function to play speech at the learner's chosen speed
+def play_audio(text):
+    st.audio(text_to_speech(text), format="audio/mp3")
     
     # Set slower playback rate for learning
     playback_rate = st.session_state.speech_speed * 0.5  # Make it even slower
-    audio_html = f'''
-    <audio controls onloadstart="this.playbackRate = {playback_rate};">
-        <source src="data:audio/mp3;base64,{audio_b64}" type="audio/mp3">
-    </audio>
+    components.html(f'''
     <script>
-        document.addEventListener('DOMContentLoaded', function() {{
-            var audioElements = document.querySelectorAll('audio');
-            audioElements.forEach(function(audio) {{
+        function applyPlaybackRate() {{
+            window.parent.document.querySelectorAll('audio').forEach(function(audio) {{
+                audio.defaultPlaybackRate = {playback_rate};
                 audio.playbackRate = {playback_rate};
             }});
-        }});
+        }}
+        applyPlaybackRate();
+        setTimeout(applyPlaybackRate, 500);
     </script>
-    '''
-    return audio_html
+    ''', height=0)
 
 # Function to split text into sentences
+SENTENCE_SPLIT_RE = re.compile(r'[.!?]+')
+
 def split_into_sentences(text):
-    import re
-    # Simple sentence splitting using regex
-    sentences = re.split(r'[.!?]+', text)
-    # Clean up sentences and remove empty ones
-    sentences = [sentence.strip() for sentence in sentences if sentence.strip()]
-    return sentences
+    # Split with the precompiled pattern, then drop empty fragments
+    return [sentence for sentence in (part.strip() for part in SENTENCE_SPLIT_RE.split(text)) if sentence]
 
 # Main app logic
 st.header("Start Your Reading Adventure!")
@@ -413,12 +476,17 @@ if st.button("Get a New Reading Passage"):
     if passage_data:
         # Load passage data into session state
         st.session_state.passage = passage_data['passage']
+        st.session_state.sentences = passage_data.get('sentences') or split_into_sentences(passage_data['passage'])  # Older passages were stored unsplit
         st.session_state.vocab_dict = passage_data['vocabulary']
         st.session_state.questions = passage_data['questions']
         st.session_state.quiz = passage_data['quiz']
         st.session_state.current_passage_id = passage_data['id']
         st.session_state.reading_start_time = time.time()  # Start reading timer
         
+        # Warm sentence and word audio in the background; the rarely played
+        # full-passage clip is left to be synthesized on demand
+        warm_speech_cache(st.session_state.sentences + list(passage_data['vocabulary']))
+        
         # # Update progress
         # st.session_state.passages_completed += 1
         # st.session_state.points += 10
@@ -427,7 +495,7 @@ if st.button("Get a New Reading Passage"):
         progress_data = {
             "points": st.session_state.points,
             "passages_completed": st.session_state.passages_completed,
-            "vocab_learned": st.session_state.vocab_learned
+            "vocab_learned": list(st.session_state.vocab_learned)
         }
         save_user_progress(progress_data)
         
@@ -442,14 +510,12 @@ if st.button("Get a New Reading Passage"):
 if "passage" in st.session_state:
     st.subheader("Reading Passage")
     
-    # Split passage into sentences for individual audio
-    sentences = split_into_sentences(st.session_state.passage)
-    
-    for i, sentence in enumerate(sentences, 1):
+    # Sentences were split when the passage was generated or loaded
+    for i, sentence in enumerate(st.session_state.sentences, 1):
         col1, col2 = st.columns([1, 10])
         with col1:
             if st.button(f"🔊 {i}", key=f"sentence_{i}", help=f"Listen to sentence {i}"):
-                st.markdown(text_to_speech(sentence), unsafe_allow_html=True)
+                play_audio(sentence)
         with col2:
             st.write(sentence + ".")
     
@@ -458,7 +524,7 @@ if "passage" in st.session_state:
     col1, col2 = st.columns([2, 8])
     with col1:
         if st.button("🔊 Full Passage", key="full_passage"):
-            st.markdown(text_to_speech(st.session_state.passage), unsafe_allow_html=True)
+            play_audio(st.session_state.passage)
     with col2:
         st.write("Play the entire passage")
 
@@ -478,6 +544,7 @@ if "passage" in st.session_state:
                     
                     # Clear current passage from session
                     del st.session_state.passage
+                    del st.session_state.sentences
                     del st.session_state.vocab_dict
                     del st.session_state.questions
                     del st.session_state.quiz
@@ -488,22 +555,14 @@ if "passage" in st.session_state:
                     progress_data = {
                         "points": st.session_state.points,
                         "passages_completed": st.session_state.passages_completed,
-                        "vocab_learned": st.session_state.vocab_learned
+                        "vocab_learned": list(st.session_state.vocab_learned)
                     }
                     save_user_progress(progress_data)
                     
                     # Start background generation for new content
-                    if not st.session_state.generating_in_background:
-                        st.session_state.generating_in_background = True
-                        
-                        def background_task():
-                            time.sleep(1)  # Small delay to let UI update
-                            generate_passage_background()
-                            st.session_state.generating_in_background = False
-                        
-                        thread = threading.Thread(target=background_task)
-                        thread.daemon = True
-                        thread.start()
+                    background_generation = st.session_state.background_generation
+                    if background_generation is None or background_generation.done():
+                        st.session_state.background_generation = get_background_executor().submit(generate_passage_background)
                         
                         st.info("🔄 Generating fresh content in the background...")
                     
@@ -524,18 +583,23 @@ if "passage" in st.session_state:
         else:
             st.write("Click when you're done reading to earn points")
 
+    # Record this passage's words as learned once, rather than on every rerun
+    if st.session_state.get("vocab_seeded_for") != st.session_state.current_passage_id:
+        for word in st.session_state.vocab_dict:
+            if word not in st.session_state.vocab_learned:
+                st.session_state.vocab_learned[word] = None
+                # st.session_state.points += 5  # Award points for learning a word
+        st.session_state.vocab_seeded_for = st.session_state.current_passage_id
+
     # Vocabulary section
     st.subheader("New Words")
     for word, definition in st.session_state.vocab_dict.items():
         col1, col2 = st.columns([1, 4])
         with col1:
             if st.button(f"🔊 {word}", key=f"word_{word}"):
-                st.markdown(text_to_speech(word), unsafe_allow_html=True)
+                play_audio(word)
         with col2:
             st.write(f"**{word}**: {definition}")
-            if word not in st.session_state.vocab_learned:
-                st.session_state.vocab_learned.append(word)
-                # st.session_state.points += 5  # Award points for learning a word
 
 # Rewards section
 st.header("Your Rewards")